@@ -1,14 +1,27 @@
+import asyncio
+import functools
 import logging
-import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from proxy_manager import ProxyManager
-from scraper import get_serp_results
+from scraper import get_serp_results, write_results
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+try:
+    import uvloop  # Optional Cython event loop; not available on Windows
+except ImportError:
+    uvloop = None
 
+# Configure logging: records are queued and written to stderr by a listener thread, off the event loop
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, logging.StreamHandler())
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[QueueHandler(log_queue)]
+)
 
-def main():
+
+async def main():
     proxy_manager = ProxyManager()
     if not proxy_manager.read_proxies("proxies.txt"):
         logging.error("No proxies loaded. Exiting.")
@@ -16,15 +29,27 @@ def main():
 
     search_terms = [f"nana{_}" for _ in range(50)]
 
-    # Dynamically determine the thread pool size based on available CPU cores
-    cpu_count = multiprocessing.cpu_count()
-    max_threads = max(10, (cpu_count * 5) // 2)
+    logging.info("Running %d searches over %d proxies.", len(search_terms), len(proxy_manager.proxies))
+
+    results_queue = asyncio.Queue()
+    writer = asyncio.create_task(write_results(results_queue, "results.jsonl"))
 
-    logging.info(f"Using a thread pool with {max_threads} threads.")
+    # Bind the shared arguments once instead of closing over them per search term
+    search = functools.partial(get_serp_results, proxy_manager=proxy_manager, results_queue=results_queue)
 
-    with ThreadPoolExecutor(max_workers=max_threads) as executor:
-        executor.map(lambda term: get_serp_results(term, proxy_manager), search_terms)
+    try:
+        # return_exceptions keeps one failed search from cancelling the others
+        await asyncio.gather(*map(search, search_terms), return_exceptions=True)
+    finally:
+        await results_queue.put(None)  # Let the writer flush and close the results file
+        await writer
+        await proxy_manager.close_sessions()
 
 
 if __name__ == "__main__":
-    main()
+    log_listener.start()
+    try:
+        # Prefer uvloop when installed so the event loop and socket handling run as native code
+        (uvloop.run if uvloop is not None else asyncio.run)(main())
+    finally:
+        log_listener.stop()
@@ -1,17 +1,20 @@
+import asyncio
 import time
-import threading
 import logging
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+import aiohttp
+from scraper import get_access_keys
 
 class ProxyManager:
     def __init__(self):
         """
-        Initializes the ProxyManager with threading lock, proxy storage, and banned proxy tracking.
+        Initializes the ProxyManager with proxy storage, proxy ownership tokens, and banned proxy tracking.
         """
-        self.lock = threading.Lock()
-        self.proxies = {}  # Stores proxies and their last used timestamps
-        self.banned_proxies = {}  # Stores banned proxies with unban timestamps
+        self.proxies = []  # Stores the loaded proxies; selection order is kept by the token queue
+        self.banned_proxies = {}  # Stores banned proxies with unban timestamps (time.monotonic_ns)
+        self._tokens = asyncio.Queue()  # One token per idle proxy, so each proxy has at most one owner
+        self.sessions = {}  # Stores one keep-alive aiohttp session per proxy
+        self._keys = None  # Cached (client_id, client_secret), fetched once per run
+        self._keys_lock = asyncio.Lock()
 
     def read_proxies(self, file_name="proxies.txt"):
         """
@@ -22,96 +25,96 @@ class ProxyManager:
         """
         try:
             with open(file_name, "r") as f:
-                self.proxies = {line.strip(): 0 for line in f if line.strip()}
+                self.proxies = list(dict.fromkeys(line.strip() for line in f if line.strip()))
 
             if not self.proxies:
                 logging.error("No proxies loaded from file.")
                 return False
 
-            logging.info(f"Loaded {len(self.proxies)} proxies from {file_name}.")
+            # Start from a fresh queue so reloading never hands out a second token for the same proxy
+            self._tokens = asyncio.Queue()
+            for proxy in self.proxies:
+                self._tokens.put_nowait(proxy)
+
+            logging.info("Loaded %d proxies from %s.", len(self.proxies), file_name)
             return True
 
         except FileNotFoundError:
-            logging.error(f"Proxies file '{file_name}' not found.")
+            logging.error("Proxies file '%s' not found.", file_name)
             return False
 
-    def get_dynamic_delay(self):
-        """
-        Calculates the minimum wait time for a proxy to be unbanned.
-
-        :return: Time in seconds until the soonest proxy is unbanned.
+    def get_session(self, proxy):
         """
-        if not self.banned_proxies:
-            return 0
+        Returns the aiohttp session bound to a proxy, creating it on first use.
 
-        min_unban_time = min(self.banned_proxies.values())
-        delay = max(0, min_unban_time - time.time())  # Time until the soonest proxy is unbanned
-        return delay
+        Reusing one session per proxy keeps its TCP/TLS connections alive across searches and retries.
 
-    def dynamic_retry_decorator(func):
+        :param proxy: The proxy key the session belongs to.
+        :return: The aiohttp.ClientSession for the proxy.
         """
-        Decorator to retry a function with a dynamically calculated delay between attempts.
-
-        :param func: Function to be decorated.
-        :return: Wrapped function with retry logic.
+        session = self.sessions.get(proxy)
+        if session is None:
+            # A proxy has one owner at a time and one tunnel per origin, so two connections suffice;
+            # a longer keep-alive lets the tunnel outlive retry backoff between searches on this proxy.
+            # Only the proxy host is resolved locally (targets are resolved by the proxy through CONNECT),
+            # so its address is cached for the lifetime of the session.
+            connector = aiohttp.TCPConnector(limit=2, keepalive_timeout=60, ttl_dns_cache=None)
+            session = aiohttp.ClientSession(connector=connector)
+            self.sessions[proxy] = session
+        return session
+
+    async def close_sessions(self):
         """
+        Closes all proxy sessions and their pooled connections.
+        """
+        sessions, self.sessions = self.sessions, {}
+        for session in sessions.values():
+            await session.close()
 
-        def wrapper(self, *args, **kwargs):
-            max_tries = 3
-            tries = 0
-
-            while tries < max_tries:
-                try:
-                    return func(self, *args, **kwargs)
-                except Exception as e:
-                    tries += 1
-                    if tries == max_tries:
-                        raise e
-
-                    # Recalculate delay time for each retry
-                    delay = self.get_dynamic_delay()
-                    logging.info(f"Attempt {tries} failed. Retrying in {delay:.2f} seconds...")
-                    time.sleep(delay)
+    async def get_or_fetch_keys(self, proxy, proxy_key):
+        """
+        Returns the cached access keys, fetching them through the given proxy on first use.
 
-        return wrapper
+        The keys are build-time constants of the playground bundle, so they are shared by all proxies.
 
-    @dynamic_retry_decorator
-    def get_proxy(self):
+        :param proxy: The proxy URL to fetch the keys through.
+        :param proxy_key: The proxy key whose session is used for the fetch.
+        :return: A tuple containing (client_id, client_secret).
         """
-        Selects the Least Recently Used (LRU) proxy that is not banned.
+        if self._keys:
+            return self._keys
+
+        async with self._keys_lock:
+            # Another task may have fetched the keys while we were waiting
+            if not self._keys:
+                self._keys = await get_access_keys(self.get_session(proxy_key), proxy)
+            return self._keys
 
-        :return: A dictionary containing the selected proxy and its key.
+    async def get_proxy(self):
         """
-        with self.lock:
-            available_proxies = {
-                proxy: last_used
-                for proxy, last_used in self.proxies.items()
-                if proxy not in self.banned_proxies or time.time() > self.banned_proxies[proxy]
-            }
+        Takes ownership of the Least Recently Used (LRU) proxy that is not banned, waiting until one is idle.
 
-            if not available_proxies:
-                delay = self.get_dynamic_delay()
-                logging.error(f"No available proxies. Retrying in {delay:.2f} seconds...")
-                raise ValueError("No available proxies, retrying...")
+        The proxy must be handed back with release_proxy once the caller is done with it.
 
-            least_used_proxy = min(available_proxies, key=available_proxies.get)
-            self.proxies[least_used_proxy] = time.time()  # Update last used time
+        :return: A tuple containing the selected proxy URL and its key.
+        """
+        # Tokens are returned in release order and banned proxies only once their ban expires,
+        # so the head of the queue is the least recently used proxy that is not banned.
+        least_used_proxy = await self._tokens.get()
 
-            return {
-                "http": f"http://{least_used_proxy}",
-                "https": f"http://{least_used_proxy}"
-            }, least_used_proxy
+        return f"http://{least_used_proxy}", least_used_proxy
 
-    def update_proxy(self, proxy):
+    def release_proxy(self, proxy):
         """
-        Updates the last-used timestamp for a given proxy.
+        Returns an owned proxy to the pool, delaying the return of a banned proxy until its ban expires.
 
-        :param proxy: The proxy to update.
+        :param proxy: The proxy to release.
         """
-        with self.lock:
-            if proxy in self.proxies:
-                self.proxies[proxy] = time.time()
-                logging.info(f"Updated proxy usage: {proxy}")
+        delay = self.banned_proxies.get(proxy, 0) - time.monotonic_ns()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay / 1e9, self._tokens.put_nowait, proxy)
+        else:
+            self._tokens.put_nowait(proxy)
 
     def ban_proxy(self, proxy):
         """
@@ -119,8 +122,9 @@ class ProxyManager:
 
         :param proxy: The proxy to be banned.
         """
-        with self.lock:
-            ban_time = time.time() + 180  # 3 minutes cooldown
-            self.banned_proxies[proxy] = ban_time
-            formatted_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ban_time))
-            logging.warning(f"Proxy {proxy} banned until {formatted_time} due to failure.")
+        # All tasks share one event loop thread and nothing here awaits, so the update needs no lock
+        self.banned_proxies[proxy] = time.monotonic_ns() + 180 * 1_000_000_000  # 3 minutes cooldown
+
+        # The monotonic clock has no calendar meaning, so log the unban time from the wall clock
+        formatted_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + 180))
+        logging.warning("Proxy %s banned until %s due to failure.", proxy, formatted_time)
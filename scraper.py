@@ -1,5 +1,8 @@
-import json
-import requests
+import asyncio
+import aiofiles
+import aiohttp
+import orjson
+import random
 import re
 from fake_useragent import UserAgent
 import logging
@@ -8,6 +11,27 @@ from datetime import datetime
 
 ua = UserAgent()
 
+# Search payload serialized once; only the JSON-encoded query ("q") is substituted per request
+_PAYLOAD_TMPL = (
+    b'{"googleDomain": "www.google.com", "gl": "us", "hl": "en", '
+    b'"uule": "w+CAIQICIeTmFudGVzLFBheXMgZGUgbGEgTG9pcmUsRnJhbmNl", '
+    b'"q": %s, "start": 0, "sum": 10, "safe": true, "filter": false, "nfpr": false, '
+    b'"captchaToken": "", "device": "desktop"}'
+)
+
+# Snapshot of user agents taken once, so requests pick from memory instead of querying fake_useragent
+_UA_POOL = [ua.random for _ in range(64)]
+
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+# Exponential backoff between retries, in seconds: base * 2 ** attempt plus up to base of jitter, capped
+_RETRY_BACKOFF_BASE = 0.1
+_RETRY_BACKOFF_CAP = 5
+
+# Matches both access keys in a single pass; group 1 is the key name, group 2 its value
+_KEYS_PREFIX = b'CF_ACCESS_CLIENT_'
+_KEYS_RE = re.compile(re.escape(_KEYS_PREFIX) + rb'(ID|SECRET):\s*"([^"]+)"')
+
 
 class RetryTracker:
     """
@@ -51,114 +75,149 @@ def retry_with_tracking(tries=10):
 
     def decorator(func):
         @wraps(func)
-        def wrapper(*args, **kwargs):
+        async def wrapper(*args, **kwargs):
             for attempt in range(tries + 1):  # Allow one original call + 10 retries
                 try:
-                    return func(*args, **kwargs)
+                    return await func(*args, **kwargs)
                 except Exception as e:
                     search_value = args[0] if args else kwargs.get('search_value')
                     retry_tracker.record_failure(search_value, attempt + 1, e)
 
                     if attempt == tries:  # Last attempt (after all retries)
-                        logging.error(f"All {tries + 1} attempts failed for search '{search_value}'")
+                        logging.error("All %d attempts failed for search '%s'", tries + 1, search_value)
                         logging.error("Failure history:")
                         for failure in retry_tracker.failed_searches[search_value]:
-                            logging.error(f"Attempt {failure['attempt']}: {failure['error']} at {failure['timestamp']}")
+                            logging.error("Attempt %d: %s at %s", failure['attempt'], failure['error'], failure['timestamp'])
                         raise  # Re-raise the last exception
 
-                    logging.warning(f"Attempt {attempt + 1}/{tries + 1} failed for '{search_value}'. Retrying...")
+                    # The proxy has been released by now, so backing off holds no shared resource
+                    delay = min(_RETRY_BACKOFF_CAP, _RETRY_BACKOFF_BASE * (2 ** attempt) + random.random() * _RETRY_BACKOFF_BASE)
+                    logging.warning(
+                        "Attempt %d/%d failed for '%s'. Retrying in %.2f seconds...",
+                        attempt + 1, tries + 1, search_value, delay
+                    )
+                    await asyncio.sleep(delay)
 
         return wrapper
 
     return decorator
 
 
-def get_access_keys(proxy):
+async def get_access_keys(session, proxy):
     """
     Extracts access keys from netnut api using a given proxy.
 
-    :param proxy: The proxy to use for the request
+    :param session: The aiohttp session bound to the proxy
+    :param proxy: The proxy URL to use for the request
     :return: A tuple containing (client_id, client_secret) if found, otherwise raises an error
     """
     url = "https://playground.netnut.io/_next/static/chunks/5396-fb805b9d40b0a4c9.js"
 
     headers = {
         'Referer': 'https://playground.netnut.io/playground/',
-        'User-Agent': ua.random,
+        'User-Agent': random.choice(_UA_POOL),
     }
 
     try:
-        response = requests.get(url, headers=headers, proxies=proxy, timeout=5)
-        data = response.text
-
-        client_id_match = re.search(r'CF_ACCESS_CLIENT_ID:\s*"([^"]+)"', data)
-        client_secret_match = re.search(r'CF_ACCESS_CLIENT_SECRET:\s*"([^"]+)"', data)
-
-        if client_id_match and client_secret_match:
-            return client_id_match.group(1), client_secret_match.group(1)
+        data = bytearray()
+        keys = {}
+        pos = 0
+
+        async with session.get(url, headers=headers, proxy=proxy, timeout=REQUEST_TIMEOUT) as response:
+            # Scan the bundle as it arrives and stop downloading once both keys are found
+            async for chunk in response.content.iter_chunked(16384):
+                data += chunk
+                # Only the new chunk plus the overlap kept from the previous one is scanned
+                for match in _KEYS_RE.finditer(data, pos):
+                    keys.setdefault(match.group(1), match.group(2))
+                    pos = match.end()
+                # A key name whose value has not fully arrived yet is rescanned from its start on the next chunk;
+                # otherwise only the tail that could hold the start of a key name split across chunks is kept
+                pending = data.rfind(_KEYS_PREFIX, pos)
+                if pending != -1:
+                    pos = pending
+                else:
+                    pos = max(pos, len(data) - len(_KEYS_PREFIX) + 1)
+                if len(keys) == 2:
+                    response.close()
+                    break
+
+        client_id, client_secret = keys.get(b"ID"), keys.get(b"SECRET")
+        if client_id and client_secret:
+            return client_id.decode(), client_secret.decode()
         else:
-            logging.warning(f"Keys not found for proxy: {proxy}. Retrying...")
+            logging.warning("Keys not found for proxy: %s. Retrying...", proxy)
             raise ValueError(f"Access keys not found for proxy: {proxy}")
 
-    except requests.RequestException as e:
-        logging.error(f"get_access_keys request failed for proxy {proxy}: {e}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error("get_access_keys request failed for proxy %s: %s", proxy, e)
         raise
 
 
 @retry_with_tracking(tries=10)
-def get_serp_results(search_value, proxy_manager):
+async def get_serp_results(search_value, proxy_manager, results_queue):
     """
     Performs a search request using the obtained access keys and a shared proxy.
 
     :param search_value: The search query to be executed
     :param proxy_manager: An instance of a proxy manager handling proxies
-    :return: None (results are saved to a file)
+    :param results_queue: An asyncio.Queue receiving (search_value, json_response) for write_results
+    :return: None (results are queued for saving)
     """
-    proxy, proxy_key = proxy_manager.get_proxy()
-
-    client_id, client_secret = get_access_keys(proxy)
-    if not client_id or not client_secret:
-        raise ValueError(f"Failed to retrieve access keys for proxy: {proxy_key}")  # Trigger retry
-
-    url = "https://netnut-api.netnut.io/api/v1/playground/search"
-
-    payload = json.dumps({
-        "googleDomain": "www.google.com",
-        "gl": "us",
-        "hl": "en",
-        "uule": "w+CAIQICIeTmFudGVzLFBheXMgZGUgbGEgTG9pcmUsRnJhbmNl",
-        "q": search_value,
-        "start": 0,
-        "sum": 10,
-        "safe": True,
-        "filter": False,
-        "nfpr": False,
-        "captchaToken": "",
-        "device": "desktop"
-    })
+    proxy, proxy_key = await proxy_manager.get_proxy()
+    try:
+        session = proxy_manager.get_session(proxy_key)
 
-    headers = {
-        'accept': 'application/json, text/plain, */*',
-        'cf-access-client-id': client_id,
-        'cf-access-client-secret': client_secret,
-        'content-type': 'application/json',
-        'origin': 'https://playground.netnut.io',
-        'referer': 'https://playground.netnut.io/',
-        'user-agent': ua.random
-    }
+        client_id, client_secret = await proxy_manager.get_or_fetch_keys(proxy, proxy_key)
+        if not client_id or not client_secret:
+            raise ValueError(f"Failed to retrieve access keys for proxy: {proxy_key}")  # Trigger retry
+
+        url = "https://netnut-api.netnut.io/api/v1/playground/search"
+
+        payload = _PAYLOAD_TMPL % orjson.dumps(search_value)
+
+        headers = {
+            'accept': 'application/json, text/plain, */*',
+            'cf-access-client-id': client_id,
+            'cf-access-client-secret': client_secret,
+            'content-type': 'application/json',
+            'origin': 'https://playground.netnut.io',
+            'referer': 'https://playground.netnut.io/',
+            'user-agent': random.choice(_UA_POOL)
+        }
 
-    response = requests.post(url, headers=headers, data=payload, proxies=proxy, timeout=5)
+        async with session.post(url, headers=headers, data=payload, proxy=proxy, timeout=REQUEST_TIMEOUT) as response:
+            # Ensure response is valid JSON (no captcha message)
+            json_response = orjson.loads(await response.read())
 
-    # Ensure response is valid JSON (no captcha message)
-    json_response = response.json()
-    if not isinstance(json_response, dict):
-        proxy_manager.ban_proxy(proxy_key)  # Ban failed proxy
-        raise ValueError("Unexpected response format, retrying...")
+        if not isinstance(json_response, dict):
+            proxy_manager.ban_proxy(proxy_key)  # Ban failed proxy
+            raise ValueError("Unexpected response format, retrying...")
 
-    # Save the response to a file
-    filename = f"{search_value}.txt"
-    with open(filename, "w") as file:
-        json.dump(json_response, file, indent=4)
-    logging.info(f"Saved results to {filename} using proxy: {proxy_key}")
+        # Hand the response over to the single writer task
+        await results_queue.put((search_value, json_response))
+        logging.info("Fetched results for %s using proxy: %s", search_value, proxy_key)
+    finally:
+        proxy_manager.release_proxy(proxy_key)  # Hand the proxy to the next waiting search
 
-    proxy_manager.update_proxy(proxy_key)
+
+async def write_results(results_queue, filename="results.jsonl"):
+    """
+    Writes queued search results to a single JSON Lines file until a None sentinel is received.
+
+    :param results_queue: An asyncio.Queue of (search_value, json_response) tuples
+    :param filename: The file the results are written to; it is overwritten on every run
+    :return: None (results are saved to the file)
+    """
+    saved = 0
+    async with aiofiles.open(filename, "wb") as file:
+        while True:
+            item = await results_queue.get()
+            if item is None:
+                break
+
+            search_value, json_response = item
+            await file.write(orjson.dumps({"q": search_value, "data": json_response}) + b"\n")
+            saved += 1
+
+    logging.info("Saved %d results to %s", saved, filename)